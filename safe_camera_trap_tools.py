@@ -5,19 +5,381 @@ and deployment that are exposed as command line entry points in the setup.
 
 import os
 import sys
+import atexit
 import argparse
 from datetime import datetime
 import csv
+import json
+import sqlite3
 import shutil
+import tempfile
+import queue
+import threading
 from itertools import groupby
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import textwrap
 import re
 import exiftool
-import progressbar
+
+# orjson is an optional, faster decoder for the JSON output from exiftool
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 DATEFIELD = 'EXIF:DateTimeOriginal'
 
+# The EXIF tags extracted from deployments: camera tags should be constant within a deployment
+CAMERA_TAGS = ['EXIF:Make', 'EXIF:Model', 'MakerNotes:SerialNumber',
+               'MakerNotes:FirmwareDate', 'File:ImageHeight', 'File:ImageWidth']
+IMAGE_TAGS = ["File:FileName", "EXIF:DateTimeOriginal", "EXIF:ExposureTime",
+              "EXIF:ISO", "EXIF:Flash", "MakerNotes:InfraredIlluminator",
+              "MakerNotes:MotionSensitivity", "MakerNotes:AmbientTemperature",
+              "EXIF:SceneCaptureType", "MakerNotes:Sequence", "MakerNotes:TriggerMode",
+              'IPTC:Keywords']
+
+# Matches the EXIF group prefix on a tag name (e.g. 'EXIF:' in 'EXIF:Make')
+_EXIF_GROUP_RE = re.compile(r'^[A-Za-z]+:')
+
+# Matches the image sequence number n in file names containing 'n of N'
+_FILE_SEQUENCE_RE = re.compile(r'\d+(?= of \d+)')
+
+# Matches keyword tags, including leading commas and spaces, using groups to keep elements
+# separate. The content of the tag is more variable than is optimal. It was initially integers,
+# then integer.integer appeared. This could be extended but sticking with numeric for the moment.
+_KEYWORD_TAG_RE = re.compile(r'([ ,]?)([0-9.]+)(:)')
+
+# Match the leading digits and any bracketed digits in keyword tags (e.g. 1(2)), for sorting
+_LEADING_DIGITS_RE = re.compile(r'^\d+')
+_BRACKETED_DIGITS_RE = re.compile(r'(?<=\()\d+(?=\))')
+
+# Pairs of full and simplified camera tag names
+_CAMERA_TAGS_SHORT = [(vl, _EXIF_GROUP_RE.sub('', vl)) for vl in CAMERA_TAGS]
+
+# The number of files copied concurrently when compiling a deployment
+COPY_WORKERS = 4
+
+# The number of copied files tagged with their original file names by each exiftool command
+TAG_BATCH = 500
+
+# The maximum number of exiftool processes used in parallel to read EXIF data
+EXIF_WORKERS = min(4, os.cpu_count() or 1)
+
+# The smallest number of files from one directory that are read by a separate exiftool process
+EXIF_MIN_CHUNK = 250
+
+# The maximum number of distinct values per file, and the minimum number of distinct values,
+# for which repeated strings in a tag are mapped onto shared instances when reading EXIF data
+SHARE_MAX_FRACTION = 1 / 8
+SHARE_MIN_VALUES = 16
+
+# The shared exiftool instances, keyed by worker number, as tuples of the instance, the lock
+# guarding its use and the id of the process that created it, and a lock guarding the creation
+# of new instances, see _exiftool
+_EXIFTOOLS = {}
+_EXIFTOOLS_LOCK = threading.Lock()
+
+# The number of bytes at the start of each image prefetched before reading EXIF data
+PREFETCH_BYTES = 128 * 1024
+
+# The buffer size used when writing extracted EXIF data
+OUTPUT_BUFFER = 1 << 20
+
+# File name extensions, in lower case, identifying JPEG images
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+# The default location of the optional cache of EXIF data read from images
+EXIF_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'safe_camera_trap_tools', 'exif.db')
+
+
+def _fast_copy(src, dst):
+    """Copies a file, keeping the data transfer within the kernel where possible.
+
+    This uses os.copy_file_range (Python 3.8+ on Linux), which avoids moving the file contents
+    through user space and creates a reflink clone on file systems that support them. It falls
+    back to shutil.copyfile if copy_file_range is not available or fails. The source files are
+    only read once, so the kernel is then told that their pages can be dropped from the cache.
+
+    Args:
+        src: The path to the file to be copied
+        dst: The path to the new copy
+    """
+
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+                remaining = os.fstat(src_file.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src_file.fileno(), dst_file.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+
+                if hasattr(os, 'posix_fadvise'):
+                    try:
+                        os.posix_fadvise(src_file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                    except OSError:
+                        pass
+
+            if remaining == 0:
+                return
+        except OSError:
+            pass
+
+    shutil.copyfile(src, dst)
+
+
+def _list_jpegs(src_dir):
+    """Lists the JPEG images and other files in a directory.
+
+    This makes a single scandir pass over the directory, letting scandir report missing
+    paths rather than checking them separately. Sub-directories are ignored. The image
+    paths are taken from the directory entries, which saves joining them to the directory.
+
+    Args:
+        src_dir: A path to a directory
+
+    Returns:
+        A tuple of a list of paths to the JPEG files and a list of the other file names
+    """
+
+    images = []
+    other_files = []
+    try:
+        with os.scandir(src_dir) as entries:
+            for ent in entries:
+                if ent.is_dir():
+                    continue
+                if ent.name.lower().endswith(JPEG_EXTENSIONS):
+                    images.append(ent.path)
+                else:
+                    other_files.append(ent.name)
+    except (FileNotFoundError, NotADirectoryError):
+        raise IOError(f'Path does not exist or is not a directory: {src_dir}')
+
+    return images, other_files
+
+
+def _prefetch_headers(files):
+    """Asks the kernel to start reading the start of each file into the page cache.
+
+    EXIF data is stored at the start of JPEG files, so this is run in a background thread
+    while exiftool reads the files, to hide read latency on cold caches and network storage.
+    It requires os.posix_fadvise, which is not available on all platforms.
+
+    Args:
+        files: A list of file names
+    """
+
+    for fl in files:
+        try:
+            fd = os.open(fl, os.O_RDONLY)
+        except OSError:
+            continue
+
+        try:
+            os.posix_fadvise(fd, 0, PREFETCH_BYTES, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def _exiftool(worker=0):
+    """Provides a running exiftool instance shared by the whole module, for use in a with block.
+
+    Starting exiftool loads the Perl interpreter and its tag tables, which takes a noticeable
+    fraction of a second. Instances are therefore started on first use and reused by later
+    calls, including across Deployment instances, and are terminated when Python exits. A
+    stay_open exiftool process can only handle one command at a time, so each instance has a
+    lock that is held for the whole with block: threads using the same worker number wait for
+    each other, and code running in parallel threads should use a different worker number in
+    each thread. Instances inherited by a forked child process share their pipes with the
+    parent process, so the child abandons them, without terminating them, and starts its own.
+
+    Args:
+        worker: The number of the shared instance to use.
+
+    Yields:
+        A running exiftool.ExifTool instance
+    """
+
+    with _EXIFTOOLS_LOCK:
+        entry = _EXIFTOOLS.get(worker)
+
+        # Marking an inherited instance as not running stops it being terminated at exit, which
+        # would stop the exiftool process of the parent.
+        if entry is not None and entry[2] != os.getpid():
+            entry[0].running = False
+            entry = None
+
+        if entry is None:
+            extl = exiftool.ExifTool()
+            entry = _EXIFTOOLS[worker] = (extl, threading.Lock(), os.getpid())
+            atexit.register(extl.terminate)
+
+        extl, lock, _ = entry
+
+    with lock:
+        if not extl.running:
+            extl.start()
+
+        yield extl
+
+
+def _reset_exiftools_lock():
+    """Replaces the lock guarding the creation of exiftool instances in a forked child process.
+
+    The child inherits the lock in whatever state it had in the parent, so it could be held by a
+    parent thread that does not exist in the child.
+    """
+
+    global _EXIFTOOLS_LOCK
+    _EXIFTOOLS_LOCK = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_exiftools_lock)
+
+
+def _start_exiftools(n_workers):
+    """Starts the shared exiftool instances for a number of workers ahead of their use.
+
+    This is run in a background thread so that the exiftool startups overlap with other work.
+    Failures are ignored here, as starting an instance is retried when it is used.
+
+    Args:
+        n_workers: The number of instances to start
+    """
+
+    for worker in range(n_workers):
+        try:
+            with _exiftool(worker):
+                pass
+        except OSError:
+            return
+
+
+def _get_tags_batch(tags, files, extl):
+    """Reads EXIF tags for a list of files.
+
+    Args:
+        tags: A list of EXIF tag names
+        files: A list of file names
+        extl: A running exiftool.ExifTool instance
+
+    Returns:
+        A list of dictionaries of tag values by file
+    """
+
+    # Read the tags, which returns a list of dictionaries of tag values by file. This is
+    # equivalent to get_tags_batch, but adds the -fast option so that exiftool does not scan
+    # to the end of each file looking for metadata trailers. The stronger -fast2 is not used
+    # as it skips the MakerNotes tags that the tools need. The JSON output is decoded here
+    # rather than by execute_json so that orjson can be used if available. The execute method
+    # needs byte inputs.
+    params = ['-fast'] + ['-' + tg for tg in tags] + files
+
+    return _json_loads(extl.execute(b'-j', *[exiftool.fsencode(pr) for pr in params]))
+
+
+def _set_preserved_file_names(extl, file_pairs):
+    """Stores the original file names of copied images in their EXIF data.
+
+    The names are stored in the XMP-xmpMM:PreservedFileName tag. Each file needs a different
+    value, so this writes a CSV file mapping each copied file to its source path and imports
+    it into all of the copies in a single exiftool command.
+
+    Args:
+        extl: A running exiftool.ExifTool instance
+        file_pairs: A list of 2-tuples of the paths of copied files and their source files
+    """
+
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8',
+                                     delete=False) as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['SourceFile', 'XMP-xmpMM:PreservedFileName'])
+        writer.writerows(file_pairs)
+
+    # The execute method needs byte inputs.
+    try:
+        extl.execute(b'-overwrite_original', b'-csv=' + exiftool.fsencode(csv_file.name),
+                     *[exiftool.fsencode(dst) for dst, _ in file_pairs])
+    finally:
+        # tidy up
+        os.remove(csv_file.name)
+
+
+class _ExifCache():
+    """A persistent cache of EXIF tag values read from files.
+
+    The values are stored in an SQLite database, keyed by the absolute file path and the set of
+    tags read. The size and modification time of each file are stored alongside the values and
+    a cached entry is only used if they match the current file, so that edited files are re-read.
+    """
+
+    def __init__(self, path):
+
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS exif (path TEXT, tags TEXT, size INTEGER, '
+                          'mtime INTEGER, data TEXT, PRIMARY KEY (path, tags))')
+
+    @staticmethod
+    def _file_keys(files):
+        """Returns (path, size, mtime) tuples identifying the current state of a list of files"""
+
+        keys = []
+        for fl in files:
+            stat = os.stat(fl)
+            keys.append((os.path.abspath(fl), stat.st_size, stat.st_mtime_ns))
+
+        return keys
+
+    def get(self, files, tags):
+        """Looks up cached tag values for a list of files.
+
+        Returns:
+            A list of dictionaries of tag values by file, with None for files that are not
+            in the cache or have changed since they were cached.
+        """
+
+        tag_key = '|'.join(tags)
+        query = 'SELECT size, mtime, data FROM exif WHERE path = ? AND tags = ?'
+        exif = []
+
+        for path, size, mtime in self._file_keys(files):
+            row = self.conn.execute(query, (path, tag_key)).fetchone()
+            if row is not None and row[0] == size and row[1] == mtime:
+                exif.append(json.loads(row[2]))
+            else:
+                exif.append(None)
+
+        return exif
+
+    def put(self, files, tags, exif):
+        """Stores tag values for a list of files"""
+
+        tag_key = '|'.join(tags)
+        rows = [(path, tag_key, size, mtime, json.dumps(dic))
+                for (path, size, mtime), dic in zip(self._file_keys(files), exif)]
+
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO exif VALUES (?, ?, ?, ?, ?)', rows)
+
+    def close(self):
+        """Closes the cache database"""
+
+        self.conn.close()
+
+
 class Deployment():
     """The Deployment class
 
@@ -26,9 +388,15 @@ class Deployment():
         2. check that the images and their EXIF data contain enough information to compile
            them into a standard deployment folder format, and
         3. create a compiled deployment folder by copying loaded images.
+
+    If exif_cache is set to the path of a cache database (such as EXIF_CACHE), EXIF data read
+    from the images is stored there and re-used for unchanged files on later runs. The number
+    of exiftool processes used to read and write EXIF data can be set using exif_workers, which
+    defaults to EXIF_WORKERS.
     """
 
-    def __init__(self, image_dirs=None, calib_dirs=None, deployment=None):
+    def __init__(self, image_dirs=None, calib_dirs=None, deployment=None, exif_cache=None,
+                 exif_workers=None):
 
         self.images = []
         self.calib = []
@@ -37,6 +405,7 @@ class Deployment():
         self.other_files = []
         self.loaded_tags = []
         self.exif_fields = None
+        self.present_tags = set()
         self.kw_tags = []
         self.location = None
         self.compilable = False
@@ -44,20 +413,27 @@ class Deployment():
         self.deployment = ''
         self.image_dirs = []
         self.calib_dirs = []
+        self.exif_cache = exif_cache
+        self.exif_workers = exif_workers
         
         # Check the inputs:
         if deployment is not None and (image_dirs or calib_dirs):
             raise ValueError('Provide one of deployment or directory lists, not both')
 
-        if deployment is not None:
-            # Check the deployment exists
-            if not os.path.exists(deployment) and os.path.isdir(deployment):
-                raise IOError('Deployment directory not found or not a directory')
+        if exif_workers is not None and exif_workers < 1:
+            raise ValueError('exif_workers must be at least 1')
 
+        if deployment is not None:
             image_dirs = [deployment]
 
-            # Check the internal structure seems like a standard deployment
-            deployment_subdirs = next(os.walk(deployment))[1]
+            # Check the deployment exists and the internal structure seems like a standard
+            # deployment. Missing paths are reported by scandir, which avoids separate stat calls.
+            try:
+                with os.scandir(deployment) as entries:
+                    deployment_subdirs = [ent.name for ent in entries if ent.is_dir()]
+            except (FileNotFoundError, NotADirectoryError):
+                raise IOError('Deployment directory not found or not a directory')
+
             if len(deployment_subdirs) == 0:
                 pass
             elif deployment_subdirs == ['CALIB']:
@@ -98,16 +474,12 @@ class Deployment():
             calib: A boolean indicating if these are calibration images
         """
 
-        if not os.path.exists(src_dir) and os.path.isdir(src_dir):
-            raise IOError(f'Path does not exist or is not a directory: {src_dir}')
+        images, other_files = _list_jpegs(src_dir)
 
-        files = next(os.walk(src_dir))[2]
-        images = [fl for fl in files if fl.lower().endswith('jpg')]
         n_images = len(images)
-        other_files = list(set(files) - set(images))
         calib_vals = [calib] * n_images
 
-        self.images.extend([os.path.join(src_dir, im) for im in images])
+        self.images.extend(images)
         self.calib.extend(calib_vals)
         self.other_files.extend(other_files)
 
@@ -147,24 +519,26 @@ class Deployment():
 
         # Load the validation data for the images
         validate_tags = [DATEFIELD, "MakerNotes:Sequence", "IPTC:Keywords"]
-        self.exif_fields = self._read_exif(self.images, validate_tags)
+        self.exif_fields, self.present_tags = self._read_exif(self.images, validate_tags,
+                                                            self.exif_cache, self.exif_workers)
         self.loaded_tags = validate_tags
         self._unpack_keywords()
 
         # Get dates and check they are complete
         self._get_dates()
-        if None in self.dates:
+        missing_dates = None in self.dates
+        if missing_dates:
             self.compilation_errors.append('Missing dates')
 
         # Check location data
         if 'Keyword_15' not in self.kw_tags:
-            exif_locations = set([None])
+            exif_locations = {None}
         elif all(x is None for x in self.exif_fields['Keyword_15']):
-            exif_locations = set([None])
+            exif_locations = {None}
         else:
             exif_locations = set(self.exif_fields['Keyword_15'])
 
-        real_exif_locations = list(exif_locations - set([None]))
+        real_exif_locations = list(exif_locations - {None})
         n_loc = len(real_exif_locations)
         loc_error = None
 
@@ -184,23 +558,22 @@ class Deployment():
         # 1) Get data from the EXIF tag, which is in 'n N' format.
         exif_sequence = [vl if vl is None else vl.split()[0]
                          for vl in self.exif_fields['MakerNotes:Sequence']]
+        missing_seq = [idx for idx, vl in enumerate(exif_sequence) if vl is None]
 
         # 2) If needed, supplement with sequence information embedded in the file names as
-        #    'n of N' and extract n
-        if None in exif_sequence:
-            regex = re.compile('\d+(?= of \d+)')
-            file_sequence = [regex.search(im) for im in self.images]
-            file_sequence = [fl[0] if fl is not None else None for fl in file_sequence]
+        #    'n of N' and extract n, only searching the names of images lacking exif data
+        if missing_seq:
+            for idx in missing_seq:
+                fl = _FILE_SEQUENCE_RE.search(self.images[idx])
+                if fl is not None:
+                    exif_sequence[idx] = fl[0]
 
-            # merge with exif sequence data, preferring exif
-            exif_sequence = [xval if xval is not None else fval
-                             for xval, fval in zip(exif_sequence, file_sequence)]
+            missing_seq = [idx for idx in missing_seq if exif_sequence[idx] is None]
 
         # 3) Lastly, if all the dates are available, make one up.
-        if None not in self.dates and None in exif_sequence:
+        if not missing_dates and missing_seq:
             # Find the datetimes of missing sequence values
-            dt_seq = zip(self.dates, exif_sequence)
-            missing_seq = [(idx, dt)  for idx, (dt, seq) in enumerate(dt_seq) if seq is None]
+            missing_seq = [(idx, self.dates[idx]) for idx in missing_seq]
 
             # Now find groups of shared dates
             missing_seq.sort(key=lambda x: x[1])
@@ -214,6 +587,21 @@ class Deployment():
 
         self.sequence = exif_sequence
 
+        # Check that the destination file names are unique, in a single pass that also
+        # collects the duplicated names for reporting
+        if not self.compilation_errors:
+            seen = set()
+            duplicates = []
+            for dest in self._get_dest_files():
+                if dest in seen:
+                    duplicates.append(dest)
+                else:
+                    seen.add(dest)
+
+            if duplicates:
+                self.compilation_errors.append(f"Duplicated image names: "
+                                               f"{','.join(duplicates[:5])}")
+
         if self.compilation_errors:
             print(f"Compilation failed: {','.join(self.compilation_errors)}",
                   file=sys.stdout, flush=True)
@@ -222,7 +610,7 @@ class Deployment():
         self.compilable = True
         return True
 
-    def compile(self, output_root):
+    def compile(self, output_root, copy_workers=None):
 
         """Compile a set of images into a standard deployment directory.
 
@@ -233,63 +621,124 @@ class Deployment():
 
         Args:
             output_root: The location to compile the deployment folder.
+            copy_workers: The number of files to copy concurrently, defaulting to COPY_WORKERS.
+                Storage with deep request queues (NVMe, network file systems) can benefit from
+                higher values, while single spinning disks may be faster with fewer.
 
         Returns:
             The name of the compiled deployment folder
         """
 
+        # progressbar2 is only used when compiling, so it is imported here rather than with
+        # the module, keeping it off the start up path of the extract_exif_data command. It is
+        # imported before anything is created, so that a missing package has no side effects.
+        import progressbar
+
+        if copy_workers is None:
+            copy_workers = COPY_WORKERS
+
         if not self.compilable and not self.compilation_errors:
             raise RuntimeError("check_compilable has not been run")
 
         if not self.compilable:
             raise RuntimeError(f"Compilation failed : {', '.join(self.compilation_errors)}")
 
-        # check the output root directory
-        if not os.path.isdir(output_root):
-            raise IOError('Output root directory not found')
-
-        # create the deployment directory
+        # create the deployment directory, using the errors from mkdir to check the output
+        # root directory exists and the deployment directory does not.
         deployment_dir = f"{self.location}_{min(self.dates).strftime('%Y%m%d')}"
         dep_path = os.path.abspath(os.path.join(output_root, deployment_dir))
 
-        if os.path.exists(dep_path):
+        try:
+            os.mkdir(dep_path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise IOError('Output root directory not found')
+        except FileExistsError:
             raise IOError(f'Output directory already exists: {deployment_dir}')
 
-        os.mkdir(dep_path)
-
-        # Get the destination file names
-        dest_files = [f'{self.location}_{dt.strftime("%Y%m%d_%H%M%S")}_{seq}.jpg'
-                      for dt, seq in zip(self.dates, self.sequence)]
+        # Get the destination file names and create a calib directory if needed
+        dest_files = self._get_dest_files()
 
-        # Create a calib directory if needed and extend the path for those images
         if True in self.calib:
             os.mkdir(os.path.join(dep_path, 'CALIB'))
-            dest_files = [os.path.join('CALIB', fl) if cl else fl
-                          for fl, cl in zip(dest_files, self.calib)]
 
-        # Move the files and insert the original file location into the EXIF metadata
+        # Start the shared exiftool instances used to insert the original filenames in the
+        # background, so that, if they are not yet running, the exiftool startups overlap with
+        # the file copies. Each batch takes a worker number from a queue while it is being
+        # written, so that the batches run in parallel on different instances.
+        n_batches = -(-len(self.images) // TAG_BATCH)
+        n_workers = min(self.exif_workers or EXIF_WORKERS, n_batches)
+        threading.Thread(target=_start_exiftools, args=(n_workers,), daemon=True).start()
+        workers = queue.Queue()
+        for worker in range(n_workers):
+            workers.put(worker)
+
+        # Copy the files, using a pool of threads to keep several copies in flight
         print('Copying files:\n', file=sys.stdout, flush=True)
+        # The destination names are relative, so can simply be appended to the deployment path
+        dep_prefix = dep_path + os.sep
+        dest_files = [dep_prefix + dst for dst in dest_files]
 
-        # get an exifread.ExifTool instance to insert the original filename
-        extl = exiftool.ExifTool()
-        extl.start()
-
+        # If a copy fails, the copies that have not started are cancelled so that the error
+        # is raised once the running copies finish, rather than after every remaining copy.
         with progressbar.ProgressBar(max_value=len(self.images)) as prog_bar:
-            for idx, (src, dst) in enumerate(zip(self.images, dest_files)):
-                # Copy the file
-                dst = os.path.join(dep_path, dst)
-                shutil.copyfile(src, dst)
-                # Insert original file name into EXIF data. The execute method needs byte inputs.
-                tag_data = f'-XMP-xmpMM:PreservedFileName={src}'
-                extl.execute(b'-overwrite_original', tag_data.encode('utf-8'),
-                             exiftool.fsencode(dst))
-                prog_bar.update(idx)
-
-        # tidy up
-        extl.terminate()
+            with ThreadPoolExecutor(max_workers=copy_workers) as executor:
+                copies = [executor.submit(_fast_copy, src, dst)
+                          for src, dst in zip(self.images, dest_files)]
+                try:
+                    for idx, copy in enumerate(as_completed(copies)):
+                        copy.result()
+                        prog_bar.update(idx)
+                except BaseException:
+                    for copy in copies:
+                        copy.cancel()
+                    raise
+
+        # Insert the original file locations into the EXIF metadata. Rather than running
+        # one exiftool command per file, this runs one command per batch of TAG_BATCH files.
+        # Writing the tag rewrites each file, so the batches are run in parallel on the
+        # exiftool instances, updating the progress bar as each batch completes.
+        print('Storing original file names:\n', file=sys.stdout, flush=True)
+        file_pairs = list(zip(dest_files, self.images))
+
+        def _tag_batch(batch):
+            worker = workers.get()
+            try:
+                with _exiftool(worker) as extl:
+                    _set_preserved_file_names(extl, batch)
+            finally:
+                workers.put(worker)
+            return len(batch)
+
+        # As for the copies, a failed batch cancels the batches that have not started.
+        with progressbar.ProgressBar(max_value=len(file_pairs)) as prog_bar:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                batches = [executor.submit(_tag_batch, file_pairs[idx:idx + TAG_BATCH])
+                           for idx in range(0, len(file_pairs), TAG_BATCH)]
+                n_tagged = 0
+                try:
+                    for batch in as_completed(batches):
+                        n_tagged += batch.result()
+                        prog_bar.update(n_tagged)
+                except BaseException:
+                    for batch in batches:
+                        batch.cancel()
+                    raise
 
         return dep_path
 
+    def _get_dest_files(self):
+        """Returns the standard names of the images in a compiled deployment: paths relative to
+        the deployment directory in the form "CALIB/location_YYYYMMDD_HHMMSS_N.jpg" for
+        calibration images and "location_YYYYMMDD_HHMMSS_N.jpg" for other images.
+        """
+
+        dest_files = [f'{self.location}_{dt.strftime("%Y%m%d_%H%M%S")}_{seq}.jpg'
+                      for dt, seq in zip(self.dates, self.sequence)]
+
+        calib_prefix = 'CALIB' + os.sep
+
+        return [calib_prefix + fl if cl else fl for fl, cl in zip(dest_files, self.calib)]
+
     def extract_data(self, outfile=None):
         """Extract EXIF data from images in a deployment
 
@@ -320,16 +769,10 @@ class Deployment():
 
         # Find images, extract EXIF data and flag as non-calibration images
         # Reduce to tags used in rest of the script, filling in blanks and simplifying tag names
-        camera_tags = ['EXIF:Make', 'EXIF:Model', 'MakerNotes:SerialNumber',
-                       'MakerNotes:FirmwareDate', 'File:ImageHeight', 'File:ImageWidth']
-        image_tags = ["File:FileName", "EXIF:DateTimeOriginal", "EXIF:ExposureTime",
-                      "EXIF:ISO", "EXIF:Flash", "MakerNotes:InfraredIlluminator",
-                      "MakerNotes:MotionSensitivity", "MakerNotes:AmbientTemperature",
-                      "EXIF:SceneCaptureType", "MakerNotes:Sequence", "MakerNotes:TriggerMode",
-                      'IPTC:Keywords']
-        target_tags = camera_tags + image_tags
-
-        self.exif_fields = self._read_exif(self.images, target_tags)
+        target_tags = CAMERA_TAGS + IMAGE_TAGS
+
+        self.exif_fields, self.present_tags = self._read_exif(self.images, target_tags,
+                                                            self.exif_cache, self.exif_workers)
         self.loaded_tags = target_tags
         self._unpack_keywords()
 
@@ -338,8 +781,13 @@ class Deployment():
         print('Checking for consistent deployment data', file=sys.stdout, flush=True)
         dep_data = OrderedDict()
 
-        # A) Check for consistent camera data
-        for long_tg, short_tg in self._strip_exif_groups(camera_tags):
+        # A) Check for consistent camera data, skipping the scan for tags that are
+        #    missing from every image
+        for long_tg, short_tg in _CAMERA_TAGS_SHORT:
+            if long_tg not in self.present_tags:
+                dep_data[short_tg] = 'NA'
+                continue
+
             vals = set(self.exif_fields[long_tg])
             vals = ['NA' if vl is None else vl for vl in vals]
             n_vals = len(vals)
@@ -354,15 +802,15 @@ class Deployment():
         self.exif_fields[DATEFIELD] = self.dates
 
         # check completeness
-        date_bad = [vl is None for vl in self.dates]
         valid_dates = [vl for vl in self.dates if vl is not None]
         n_img = len(self.images)
+        n_valid = len(valid_dates)
 
-        if all(date_bad):
-            print('  ! No {DATEFIELD} tags found', file=sys.stderr, flush=True)
+        if n_valid == 0:
+            print(f'  ! No {DATEFIELD} tags found', file=sys.stderr, flush=True)
         else:
-            if any(date_bad):
-                print(f'  ! {DATEFIELD} tags not complete: {n_img - sum(date_bad)}/n_img',
+            if n_valid < n_img:
+                print(f'  ! {DATEFIELD} tags not complete: {n_valid}/{n_img}',
                       file=sys.stderr, flush=True)
 
             # get the date range
@@ -383,7 +831,7 @@ class Deployment():
             # Check for missing location tags (Keyword_15: None) and remove
             if None in locations:
                 print(f'  ! Some images lack location tags.', file=sys.stderr, flush=True)
-                locations -= set([None])
+                locations.discard(None)
 
             if len(locations) > 1:
                 locations = ', '.join(locations)
@@ -403,8 +851,9 @@ class Deployment():
             dep_data['location'] = locations
 
         # Add the number of images
-        dep_data['n_images'] = n_img - sum(self.calib)
-        dep_data['n_calib'] = sum(self.calib)
+        n_calib = self.calib.count(True)
+        dep_data['n_images'] = n_img - n_calib
+        dep_data['n_calib'] = n_calib
 
         # print to screen to report
         print('Deployment data:', file=sys.stdout, flush=True)
@@ -418,37 +867,33 @@ class Deployment():
         else:
             print('Image tag counts:', file=sys.stdout, flush=True)
             for tag in self.kw_tags:
-                n_found = sum([vl is not None for vl in self.exif_fields[tag]])
+                n_found = n_img - self.exif_fields[tag].count(None)
                 print(f'    {tag:10}{n_found:6}', file=sys.stdout, flush=True)
 
-        # WRITE data to files
-        with open(outfile, 'w') as outf:
+        # WRITE data to file, opened once with a large buffer to reduce the number of writes
+        with open(outfile, 'w', buffering=OUTPUT_BUFFER, newline='') as outf:
             # Header containing constant deployment data
             outf.write(f'Header length: {len(dep_lines) + 1}\n')
             outf.writelines(ln + '\n' for ln in dep_lines)
 
-        with open(outfile, 'a') as outf:
             # Tab delimited table of image data
             writer = csv.writer(outf, delimiter='\t', lineterminator='\n')
 
-            # Insert file name and calib status into dictionary
+            # Generate the file names as the rows are written, rather than building full lists
             if self.deployment:
-                file_names = [os.path.basename(im) for im in self.images]
-                file_names = [os.path.join('CALIB', im) if cl else im
-                              for im, cl in zip(file_names, self.calib)]
+                file_names = (os.path.join('CALIB', os.path.basename(im)) if cl
+                              else os.path.basename(im)
+                              for im, cl in zip(self.images, self.calib))
             else:
-                file_names = [os.path.abspath(im) for im in self.images]
-
-            output_data = OrderedDict([('File', file_names), ('Calib', self.calib)])
+                file_names = map(os.path.abspath, self.images)
 
-            # Add the fields to the output data directory, stripping EXIF groups
+            # Get the fields to output, stripping EXIF groups from the column names
             tags = self._strip_exif_groups(self.exif_fields)
-            for long_tag, short_tag in tags:
-                output_data[short_tag] = self.exif_fields[long_tag]
+            columns = [self.exif_fields[long_tag] for long_tag, _ in tags]
 
-            data = zip(*output_data.values())
-            writer.writerow(output_data.keys())
-            writer.writerows(data)
+            # Stream the rows straight from the columns to the writer
+            writer.writerow(['File', 'Calib'] + [short_tag for _, short_tag in tags])
+            writer.writerows(zip(file_names, self.calib, *columns))
 
         # tidy up
         print(f'Data written to {outfile}', file=sys.stdout, flush=True)
@@ -459,8 +904,7 @@ class Deployment():
         of 2-tuples of provided and simplified names.
         """
 
-        exif_group = re.compile('[A-z]+:')
-        tags = [(vl, exif_group.sub('', vl)) for vl in tags]
+        tags = [(vl, _EXIF_GROUP_RE.sub('', vl)) for vl in tags]
 
         return tags
 
@@ -490,12 +934,8 @@ class Deployment():
         if keywords is None:
             return {}
         
-        # Use regex to find tags, including leading commas and spaces, using
-        # groups to keep elements separate. The content of the tag is more variable
-        # than is optimal. It was initially integers, then integer.integer appeared.
-        # This could be extended but sticking with numeric for the moment.
-        tag_regex = re.compile('([ ,]?)([0-9.]+)(:)')
-        tag_regex_out = list(tag_regex.finditer(keywords))
+        # Use regex to find tags, including leading commas and spaces
+        tag_regex_out = list(_KEYWORD_TAG_RE.finditer(keywords))
         
         # extract tag identity
         tags = [t.groups()[1] for t in tag_regex_out]
@@ -517,45 +957,120 @@ class Deployment():
         # # Convert non-standard tags - TODO reimplement some kind of mapping if needed?
         # keywords = [self.tag_map[kw] if kw in self.tag_map else kw for kw in keywords]
 
-        # Sort and group on tag number
-        kw_list.sort(key=lambda x: x[0])
-        kw_groups = groupby(kw_list, key=lambda x: x[0])
+        # Group values on tag number in a single pass, preserving the order of values
+        kw_groups = defaultdict(list)
+        for key, val in kw_list:
+            kw_groups[key].append(val.strip())
 
         # Turn that into a dictionary
-        kw_dict = {}
-        for key, vals in kw_groups:
-            kw_dict[key] = ', '.join(vl[1].strip() for vl in vals)
+        kw_dict = {key: ', '.join(vals) for key, vals in kw_groups.items()}
 
         return kw_dict
 
     @staticmethod
-    def _read_exif(files, tags):
+    def _read_exif(files, tags, cache_file=None, workers=None):
         """Read EXIF tags for a list of files.
 
         It returns an ordered dictionary, ordered by the original tag list, of EXIF tag values
         for each of the provided files. Empty tags for a file and tags that are missing completely
-        across all files are filled with None.
+        across all files are filled with None. It also returns the set of tags that have a value
+        in at least one file, so that callers can skip scanning tags that are entirely empty.
 
         Args:
             files: A list of file names
             tags: A list of EXIF tag names. These are shortened to remove EXIF group prefixes.
+            cache_file: An optional path to a cache database of previously read EXIF data.
+            workers: The maximum number of exiftool processes to use, defaulting to EXIF_WORKERS.
 
         Returns:
-            An ordered dict keyed by tag names.
+            A tuple of an ordered dict keyed by tag names and a set of present tag names.
         """
 
-        # get an exifread.ExifTool instance and read, which returns a list of dictionaries
-        # of tag values by file
-        extl = exiftool.ExifTool()
-        extl.start()
-        exif = extl.get_tags_batch(tags, files)
-        extl.terminate()
+        # Look for unchanged files in the cache and only read the remaining files
+        if cache_file is not None:
+            cache = _ExifCache(cache_file)
+            exif = cache.get(files, tags)
+            to_read = [fl for fl, dic in zip(files, exif) if dic is None]
+        else:
+            exif = [None] * len(files)
+            to_read = files
+
+        # Start prefetching the EXIF data from the files to be read
+        if to_read and hasattr(os, 'posix_fadvise'):
+            threading.Thread(target=_prefetch_headers, args=(to_read,), daemon=True).start()
+
+        # Read chunks of files with separate exiftool processes. Exiftool is CPU bound decoding
+        # tags, so running several processes in parallel scales well, and threads are enough
+        # to drive them as the Python side is only waiting on the pipes. Files are chunked by
+        # source directory and large directories are split further so that they can also use
+        # several workers, but chunks are kept large enough to be worth an exiftool startup.
+        if workers is None:
+            workers = EXIF_WORKERS
+
+        chunk_size = max(EXIF_MIN_CHUNK, -(-len(to_read) // workers))
+        chunks = []
+        for _, grp in groupby(to_read, key=os.path.dirname):
+            grp = list(grp)
+            chunks.extend(grp[idx:idx + chunk_size] for idx in range(0, len(grp), chunk_size))
+
+        n_workers = min(workers, len(chunks))
+
+        if n_workers > 1:
+            # Deal the chunks out to the workers, each reading its chunks in turn with its own
+            # shared exiftool instance, then put the results back into the chunk order.
+            def _read_chunks(worker):
+                with _exiftool(worker) as extl:
+                    return [_get_tags_batch(tags, chk, extl)
+                            for chk in chunks[worker::n_workers]]
+
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(_read_chunks, range(n_workers)))
+
+            new_exif = [dic for idx in range(len(chunks))
+                        for dic in results[idx % n_workers][idx // n_workers]]
+        elif to_read:
+            with _exiftool() as extl:
+                new_exif = _get_tags_batch(tags, to_read, extl)
+        else:
+            new_exif = []
 
-        # Convert list of dictionaries to a dictionary of lists, using OrderedDict to
-        # preserve the field order of the tags when the data is written to file.
-        exif_fields = OrderedDict([(tg, [dic.get(tg, None) for dic in exif]) for  tg in tags])
+        if cache_file is not None:
+            cache.put(to_read, tags, new_exif)
+            cache.close()
 
-        return exif_fields
+        # Merge the newly read data into the cached data, preserving the file order
+        new_exif = iter(new_exif)
+        exif = [next(new_exif) if dic is None else dic for dic in exif]
+
+        # Convert list of dictionaries to a dictionary of lists, using OrderedDict to
+        # preserve the field order of the tags when the data is written to file. This is
+        # done in a single pass over the files, which also:
+        # - maps repeated strings onto a single shared instance. The JSON decoder creates a new
+        #   object for every value, so low cardinality tags (camera make, model, location
+        #   keywords) would otherwise hold N copies of a handful of strings. Only strings are
+        #   shared, as equal values of other types (1, 1.0, True) would merge into one. Tags
+        #   that are close to unique for each file (file names, dates) gain nothing from this,
+        #   so a tag stops sharing values once it has more than SHARE_MAX_FRACTION distinct
+        #   values per file.
+        # - records which tags have a value in any file: exiftool omits tags that a file lacks.
+        exif_fields = OrderedDict([(tg, []) for tg in tags])
+        columns = [[tg, exif_fields[tg].append, {}] for tg in tags]
+        max_shared = max(SHARE_MIN_VALUES, int(len(exif) * SHARE_MAX_FRACTION))
+        present_tags = set()
+
+        for dic in exif:
+            for col in columns:
+                tg, append, shared = col
+                vl = dic.get(tg, None)
+                if vl is not None:
+                    if shared is not None and isinstance(vl, str):
+                        vl = shared.setdefault(vl, vl)
+                        if len(shared) > max_shared:
+                            col[2] = None
+                    present_tags.add(tg)
+                append(vl)
+
+        return exif_fields, present_tags
 
     def _get_dates(self):
         """Converts EXIF dates to datetime.datetime and stores in self.dates"""
@@ -566,11 +1081,17 @@ class Deployment():
             raise RuntimeError(f'{DATEFIELD} not in loaded EXIF data')
         
         # EXIF should have a consistent datetime format of "YYYY:mm:dd HH:MM:SS"
-        # but we do need to handle corrupt dates.
+        # but we do need to handle corrupt dates. The format is fixed width, so the fields
+        # are sliced out directly, which is much faster than datetime.strptime.
         def _date_conv(dt):
             
+            # Check the separators, at positions 4, 7, 10, 13 and 16
+            if len(dt) != 19 or dt[4::3] != ':: ::':
+                return None
+
             try:
-                dt = datetime.strptime(dt, '%Y:%m:%d %H:%M:%S')
+                dt = datetime(int(dt[0:4]), int(dt[5:7]), int(dt[8:10]),
+                              int(dt[11:13]), int(dt[14:16]), int(dt[17:19]))
             except ValueError:
                 dt = None
             
@@ -583,32 +1104,36 @@ class Deployment():
         """Unpack EXIF keywords
 
         Unpacks the IPTC:Keywords tag in data loaded into self.exif_fields into new fields
-        keyed by keyword tag number n as 'Keyword_n'. If there is no Keywords field, exif_fields
-        is unchanged; otherwise the keyword tags are added at the end in numeric order and the
-        Keywords fields is removed. It also populates the self.kw_tags attribute with the
+        keyed by keyword tag number n as 'Keyword_n'. If no image has keywords, no fields are
+        added; otherwise the keyword tags are added at the end in numeric order. The Keywords
+        field is removed. It also populates the self.kw_tags attribute with the
         resulting keyword field keys.
         """
 
         kw_field = 'IPTC:Keywords'
+        self.kw_tags = []
 
-        if kw_field in self.exif_fields or any(x is not None for x in self.exif_fields[kw_field]):
+        # _read_exif records which tags have a value in any file, so images only need to be
+        # unpacked if at least one of them has keywords
+        if kw_field in self.present_tags:
 
-            # Convert the entries from a list to a dict keyed by tag
-            kw_data = [self._convert_keywords(kw) for kw in self.exif_fields[kw_field]]
+            # Convert the entries from a list to a dict keyed by tag, finding the common set of
+            # tags in the same pass
+            kw_data = []
+            keyword_tags = set()
+            for kw in self.exif_fields[kw_field]:
+                kw_dict = self._convert_keywords(kw)
+                kw_data.append(kw_dict)
+                keyword_tags.update(kw_dict)
 
-            # Find the common set
-            keyword_tags = [list(d.keys()) for d in kw_data]
-            keyword_tags = list({tg for tag_list in keyword_tags for tg in tag_list})
+            keyword_tags = list(keyword_tags)
 
             # now sort into numeric order for clean reporting. Mostly, tags are integer
             # but there are sometimes bracketed values, e.g. 1(2)
-            leading_digits = re.compile('^\d+')
-            bracketed_digit = re.compile('(?<=\()\d+(?=\))')
+            keyword_ld = [_LEADING_DIGITS_RE.search(x) for x in keyword_tags]
+            keyword_bd = [_BRACKETED_DIGITS_RE.search(x) for x in keyword_tags]
 
-            keyword_ld = [leading_digits.search(x) for x in keyword_tags]
-            keyword_bd = [bracketed_digit.search(x) for x in keyword_tags]
-
-            if any([vl is None for vl in keyword_ld]):
+            if None in keyword_ld:
                 raise ValueError(f"Could not parse keyword tags: {', '.join(keyword_tags)}")
 
             keyword_ld = [int(x[0]) for x in keyword_ld]
@@ -638,6 +1163,27 @@ Command line interfaces
 """
 
 
+def _positive_int(value):
+    """Converts a command line argument to an integer of at least 1, for use as an argparse type.
+
+    Args:
+        value: The argument string
+
+    Returns:
+        The integer value
+    """
+
+    try:
+        value = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid int value: {value!r}')
+
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1: {value}')
+
+    return value
+
+
 def _process_deployment_cli():
 
     """
@@ -671,10 +1217,25 @@ def _process_deployment_cli():
     parser.add_argument('-l', '--location', type=str, default=None,
                         help='A SAFE location code to be checked against any location tags '
                              'tags in the images and used for the deployment folder.')
+    parser.add_argument('--exif_cache', action='store_true',
+                        help='Cache EXIF data read from images so that unchanged images are '
+                             'not read again on later runs.')
+    parser.add_argument('--exif_cache_file', type=str, default=None,
+                        help='A path to the EXIF cache file, which implies --exif_cache. '
+                             'Defaults to ~/.cache/safe_camera_trap_tools/exif.db.')
+    parser.add_argument('-j', '--jobs', type=_positive_int, default=None,
+                        help='The number of exiftool processes used in parallel to read EXIF '
+                             'data and to store the original file names, defaulting to the '
+                             'number of CPUs, up to 4.')
 
     args = parser.parse_args()
 
-    dep = Deployment(image_dirs=args.images, calib_dirs=args.calib)
+    exif_cache = args.exif_cache_file
+    if exif_cache is None and args.exif_cache:
+        exif_cache = EXIF_CACHE
+
+    dep = Deployment(image_dirs=args.images, calib_dirs=args.calib,
+                     exif_cache=exif_cache, exif_workers=args.jobs)
     can_compile = dep.check_compilable(location=args.location)
 
     if can_compile:
@@ -705,9 +1266,23 @@ def _extract_exif_data_cli():
     parser.add_argument('-c', '--calib_dirs', default=[], type=str, action='append',
                         help='A path to a folder of calibration images. Can be repeated to '
                              'provide more than one folder of calibration images.')
+    parser.add_argument('--exif_cache', action='store_true',
+                        help='Cache EXIF data read from images so that unchanged images are '
+                             'not read again on later runs.')
+    parser.add_argument('--exif_cache_file', type=str, default=None,
+                        help='A path to the EXIF cache file, which implies --exif_cache. '
+                             'Defaults to ~/.cache/safe_camera_trap_tools/exif.db.')
+    parser.add_argument('-j', '--jobs', type=_positive_int, default=None,
+                        help='The number of exiftool processes used in parallel to read EXIF '
+                             'data, defaulting to the number of CPUs, up to 4.')
 
     args = parser.parse_args()
 
+    exif_cache = args.exif_cache_file
+    if exif_cache is None and args.exif_cache:
+        exif_cache = EXIF_CACHE
+
     dep = Deployment(image_dirs=args.image_dirs, calib_dirs=args.calib_dirs,
-                     deployment=args.deployment)
+                     deployment=args.deployment, exif_cache=exif_cache,
+                     exif_workers=args.jobs)
     dep.extract_data(outfile=args.outfile)